@@ -29,100 +29,210 @@ is replaced by a transition card matching the main on the previous rule's featur
 """
 
 import random
-from itertools import combinations
+from functools import lru_cache, partial
+from itertools import combinations, product
+
+import numpy as np
 
 TOTAL_RULES      = 19
 TRANSITION_TRIALS = 3
 
+# Default RNG for helpers called directly. iter_all_trials builds its own
+# random.Random per run and passes it down, so seeded runs never touch this
+# instance (or the global `random` state shared with the Streamlit process).
+_rng = random.Random()
+
+_VALUES = (1, 2, 3, 4)
+
+# _OTHER[v] = the three forms that differ from v (index 0 unused).
+_OTHER = (None, (2, 3, 4), (1, 3, 4), (1, 2, 4), (1, 2, 3))
+
 
 # ---------------------------------------------------------------------------
 # Low-level helpers
 # ---------------------------------------------------------------------------
 
-def get_different_value(current):
-    return random.choice([v for v in range(1, 5) if v != current])
+def set_different_values(card, main, positions, rng=_rng):
+    """
+    Set card[p] to a value != main[p] for every p in positions.
+    All values come from one randrange(3**k) draw, one base-3 digit each.
+    """
+    r = rng.randrange(3 ** len(positions))
+    for p in positions:
+        r, k = divmod(r, 3)
+        card[p] = _OTHER[main[p]][k]
 
 
-def generate_random_card(active_positions):
+def generate_random_card(active_positions, rng=_rng):
     card = [0, 0, 0, 0]
-    for p in active_positions:
-        card[p] = random.randint(1, 4)
+    for p, v in zip(active_positions, rng.choices(_VALUES, k=len(active_positions))):
+        card[p] = v
     return card
 
 
+def draw_main_cards(rng, n, active_positions):
+    """n random cards drawn in a single NumPy call (inactive positions stay 0)."""
+    cards = np.zeros((n, 4), dtype=np.int64)
+    cards[:, active_positions] = rng.integers(1, 5, size=(n, len(active_positions)))
+    return cards.tolist()
+
+
+def draw_option_orders(rng, n):
+    """n random permutations of the 4 option slots, drawn in a single NumPy call."""
+    return rng.permuted(np.tile(np.arange(4), (n, 1)), axis=1).tolist()
+
+
+# Codes and image paths of every card the generator can produce (3-symbol
+# cards end in 0) are built once at import; anything else is memoized on
+# first use.
+_CODE_CACHE = {}
+_PATH_CACHE = {}
+for _k in product(_VALUES, _VALUES, _VALUES, (0,) + _VALUES):
+    _CODE_CACHE[_k] = f"{_k[0]}{_k[1]}{_k[2]}{_k[3]}"
+    _PATH_CACHE[_k] = f"cards/{_CODE_CACHE[_k]}.png"
+del _k
+
+
 def card_to_code(card):
-    return "".join(str(v) for v in card)
+    k = (card[0], card[1], card[2], card[3])
+    s = _CODE_CACHE.get(k)
+    if s is None:
+        s = f"{k[0]}{k[1]}{k[2]}{k[3]}"
+        _CODE_CACHE[k] = s
+        _PATH_CACHE[k] = f"cards/{s}.png"
+    return s
 
 
-def count_matches(main, other, positions):
-    return sum(1 for p in positions if main[p] == other[p])
+def card_to_path(card):
+    k = (card[0], card[1], card[2], card[3])
+    path = _PATH_CACHE.get(k)
+    if path is None:
+        card_to_code(card)
+        path = _PATH_CACHE[k]
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Packed card encoding
+# ---------------------------------------------------------------------------
+# A card packs into 16 bits, one nibble per position (position 0 = low nibble).
+# XOR-ing two packed cards leaves a zero nibble wherever they match, so the
+# number of matches on a set of positions is a single table lookup.
+
+def card_to_u16(card):
+    return card[0] | (card[1] << 4) | (card[2] << 8) | (card[3] << 12)
+
+
+def positions_mask(positions):
+    """OR of the nibble masks (0x000F, 0x00F0, ...) for the given positions."""
+    mask = 0
+    for p in positions:
+        mask |= 0xF << (4 * p)
+    return mask
+
+
+# DIFF_TABLE[xor] = number of non-zero nibbles in a 16-bit XOR value.
+DIFF_TABLE = bytes(
+    (x & 0x000F != 0) + (x & 0x00F0 != 0) + (x & 0x0F00 != 0) + (x & 0xF000 != 0)
+    for x in range(1 << 16)
+)
 
 
 # ---------------------------------------------------------------------------
 # Core card-generation primitives
 # ---------------------------------------------------------------------------
 
+def position_bits(positions):
+    """4-bit mask with bit p set for every position p."""
+    bits = 0
+    for p in positions:
+        bits |= 1 << p
+    return bits
+
+
+def bits_to_positions(bits):
+    """Inverse of position_bits, in ascending position order."""
+    positions = []
+    while bits:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return positions
+
+
 def generate_matching_card(main, active_positions, n_match,
-                            must_match=None, must_differ=None):
-    must_match  = set(must_match  or [])
-    must_differ = set(must_differ or [])
+                            must_match=None, must_differ=None, rng=_rng):
+    mm = position_bits(must_match  or ())
+    md = position_bits(must_differ or ())
 
-    if must_match & must_differ:
-        raise ValueError(f"must_match and must_differ overlap: {must_match & must_differ}")
+    if mm & md:
+        raise ValueError(f"must_match and must_differ overlap: {bits_to_positions(mm & md)}")
 
-    free    = [p for p in active_positions if p not in must_match and p not in must_differ]
-    n_extra = n_match - len(must_match)
+    active  = position_bits(active_positions)
+    free    = bits_to_positions(active & ~mm & ~md)
+    n_extra = n_match - mm.bit_count()
 
     if n_extra < 0 or n_extra > len(free):
         raise ValueError(
             f"Cannot achieve {n_match} matches with "
-            f"must_match={must_match}, must_differ={must_differ}, free={free}"
+            f"must_match={bits_to_positions(mm)}, must_differ={bits_to_positions(md)}, free={free}"
         )
 
-    card = [0, 0, 0, 0]
-    for p in must_match:
-        card[p] = main[p]
-    for p in must_differ:
-        card[p] = get_different_value(main[p])
-
-    extra_match = set(random.sample(free, n_extra))
-    for p in free:
-        card[p] = main[p] if p in extra_match else get_different_value(main[p])
+    # Partial Fisher-Yates: the first n_extra entries of `free` become matches.
+    for i in range(n_extra):
+        j = rng.randrange(i, len(free))
+        free[i], free[j] = free[j], free[i]
+
+    matched = mm
+    for p in free[:n_extra]:
+        matched |= 1 << p
+
+    # One pass: each used position either copies main or joins `differ`.
+    card   = [0, 0, 0, 0]
+    differ = []
+    for p in bits_to_positions(active | mm | md):
+        if matched >> p & 1:
+            card[p] = main[p]
+        else:
+            differ.append(p)
+    set_different_values(card, main, differ, rng)
 
     return card
 
 
-def generate_not_both_rule_match(main, active_positions, rule_features, n_match=2):
+def generate_not_both_rule_match(main, active_positions, rule_features, n_match=2, rng=_rng):
     """2 total matches where NOT both rule features are among them."""
     rule_features = list(rule_features)
     non_rule = [p for p in active_positions if p not in rule_features]
 
     max_rf = min(len(rule_features) - 1, n_match)
     min_rf = max(0, n_match - len(non_rule))
-    n_rf   = random.randint(min_rf, max_rf)
+    n_rf   = rng.randint(min_rf, max_rf)
 
-    matched_rf   = set(random.sample(rule_features, n_rf))
+    matched_rf   = set(rng.sample(rule_features, n_rf))
     unmatched_rf = set(rule_features) - matched_rf
 
     return generate_matching_card(main, active_positions, n_match,
                                   must_match=matched_rf,
-                                  must_differ=unmatched_rf)
+                                  must_differ=unmatched_rf,
+                                  rng=rng)
 
 
 # ---------------------------------------------------------------------------
 # Per-rule option generation
 # ---------------------------------------------------------------------------
 
-def _build_correct(main, rf, non_rf, active_positions):
+def _build_correct(main, rf, non_rf, active_positions, rng=_rng):
     """Correct card: exactly the 2 rule features match, all others differ."""
     return generate_matching_card(main, active_positions, 2,
-                                  must_match=set(rf),
-                                  must_differ=set(non_rf))
+                                  must_match=rf,
+                                  must_differ=non_rf,
+                                  rng=rng)
 
 
-def _build_wrong_cards(main, rf, active_positions, rule_num):
-    g   = generate_matching_card
-    gnr = generate_not_both_rule_match
+def _build_wrong_cards(main, rf, active_positions, rule_num, rng=_rng):
+    g   = partial(generate_matching_card, rng=rng)
+    gnr = partial(generate_not_both_rule_match, rng=rng)
 
     if rule_num == 1:
         return [g(main, active_positions, 0),
@@ -180,20 +290,33 @@ def options_have_duplicates(options):
 # ---------------------------------------------------------------------------
 
 def generate_trial(rule_num, rule_features, active_positions,
-                   prev_rule_features=None, is_transition=False):
-    rf     = list(rule_features)
-    non_rf = [p for p in active_positions if p not in rf]
+                   prev_rule_features=None, is_transition=False, main=None,
+                   non_rf=None, non_prev_rf=None, order=None, rng=_rng):
+    """
+    `main` is an optional pre-drawn main card used for the first attempt.
+    `non_rf` / `non_prev_rf` are the active positions outside the (previous)
+    rule features; callers generating many trials per rule pass them in
+    precomputed.
+    `order` is a permutation of range(4): slot i shows option order[i],
+    where option 0 is the correct card. Drawn from `rng` when not given.
+    `rng` is the random.Random that draws everything else.
+    """
+    rf = tuple(rule_features)
+    if non_rf is None:
+        non_rf = [p for p in active_positions if p not in rf]
     for attempt in range(100):
-        main    = generate_random_card(active_positions)
-        correct = _build_correct(main, rf, non_rf, active_positions)
-        wrong   = _build_wrong_cards(main, rf, active_positions, rule_num)
+        if attempt or main is None:
+            main = generate_random_card(active_positions, rng)
+        correct = _build_correct(main, rf, non_rf, active_positions, rng)
+        wrong   = _build_wrong_cards(main, rf, active_positions, rule_num, rng)
 
         if is_transition and prev_rule_features:
-            prf     = list(prev_rule_features)
-            non_prf = [p for p in active_positions if p not in prf]
+            if non_prev_rf is None:
+                non_prev_rf = [p for p in active_positions if p not in prev_rule_features]
             wrong[-1] = generate_matching_card(main, active_positions, 2,
-                                            must_match=set(prf),
-                                            must_differ=set(non_prf))
+                                            must_match=prev_rule_features,
+                                            must_differ=non_prev_rf,
+                                            rng=rng)
 
         options = [correct] + wrong
         if (not options_have_uniform_feature(options, active_positions)
@@ -202,43 +325,66 @@ def generate_trial(rule_num, rule_features, active_positions,
     else:
         raise RuntimeError("Failed to generate valid trial after 100 attempts")
         
-    perm    = list(range(4))
-    random.shuffle(perm)
-    shuffled      = [options[i] for i in perm]
-    correct_index = perm.index(0)
-
-    return {
-        "main":               main,
+    if order is None:
+        order = rng.sample(range(4), 4)
+    shuffled      = [options[k] for k in order]
+    correct_index = order.index(0)
+
+    # Cards are frozen to tuples: smaller than lists and safe to share.
+    u16s  = [None] * 4
+    codes = [None] * 4
+    paths = [None] * 4
+    for i, c in enumerate(shuffled):
+        shuffled[i] = tuple(c)
+        u16s[i]     = card_to_u16(c)
+        codes[i]    = card_to_code(c)
+        paths[i]    = card_to_path(c)
+
+    trial = {
+        "main":               tuple(main),
+        "main_u16":           card_to_u16(main),
         "main_code":          card_to_code(main),
-        "main_path":          f"cards/{card_to_code(main)}.png",
-        "options":            shuffled,
-        "option_codes":       [card_to_code(c) for c in shuffled],
-        "option_paths":       [f"cards/{card_to_code(c)}.png" for c in shuffled],
+        "main_path":          card_to_path(main),
+        "options":            tuple(shuffled),
+        "options_u16":        tuple(u16s),
+        "option_codes":       tuple(codes),
+        "option_paths":       tuple(paths),
         "correct":            correct_index,
         "rule":               rule_num,
         "rule_features":      rf,
-        "prev_rule_features": list(prev_rule_features) if prev_rule_features else None,
+        "rule_mask":          positions_mask(rf),
+        "prev_rule_features": tuple(prev_rule_features) if prev_rule_features else None,
+        "prev_rule_mask":     positions_mask(prev_rule_features or ()),
         "active_positions":   active_positions,
         "is_transition":      is_transition,
     }
+    # Every option's verdict is known now; answer checking is a lookup.
+    trial["verdicts"]       = tuple(_classify(trial, i) for i in range(4))
+    trial["perseverations"] = tuple(_perseverates(trial, i) for i in range(4))
+    return trial
 
 
 # ---------------------------------------------------------------------------
 # Top-level: generate all trials
 # ---------------------------------------------------------------------------
 
-def generate_all_trials(trials_per_rule=10, transition_trials=TRANSITION_TRIALS, seed=None):
+def iter_all_trials(trials_per_rule=10, transition_trials=TRANSITION_TRIALS, seed=None):
     """
-    Generate trials for all 19 rules.
+    Lazily yield trials for all 19 rules, in order.
     Rules 1-2  -> Stage 1 (3-symbol)
     Rules 3-19 -> Stage 2 (4-symbol)
-    The app stops at 60 counted trials; we generate the full buffer.
+    Each trial is only built when requested, so a consumer that stops early
+    (e.g. via itertools.islice) skips the remaining generation work.
+    Main cards and option orders for each rule are drawn up front in NumPy
+    batches.
+    Each run draws from its own random.Random, so interleaved generators
+    don't disturb each other and seeding one leaves unseeded runs alone.
     """
-    if seed is not None:
-        random.seed(seed)
+    rng    = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
 
-    active_3 = [0, 1, 2]
-    active_4 = [0, 1, 2, 3]
+    active_3 = (0, 1, 2)
+    active_4 = (0, 1, 2, 3)
     pairs_3  = list(combinations(active_3, 2))
     pairs_4  = list(combinations(active_4, 2))
 
@@ -246,49 +392,97 @@ def generate_all_trials(trials_per_rule=10, transition_trials=TRANSITION_TRIALS,
     for r in range(1, TOTAL_RULES + 1):
         pairs = pairs_3 if r <= 2 else pairs_4
         prev  = rule_features.get(r - 1)
-        candidates = [p for p in pairs if p != prev] if (prev in pairs) else pairs
-        rule_features[r] = random.choice(candidates)
+        if prev in pairs:
+            # Uniform over the other pairs: draw from all but the last slot
+            # and let the last pair stand in for `prev`.
+            idx = rng.randrange(len(pairs) - 1)
+            if pairs[idx] == prev:
+                idx = len(pairs) - 1
+        else:
+            idx = rng.randrange(len(pairs))
+        rule_features[r] = pairs[idx]
 
-    all_trials = []
     for rule_num in range(1, TOTAL_RULES + 1):
-        active  = active_3 if rule_num <= 2 else active_4
+        stage   = 1 if rule_num <= 2 else 2
+        active  = active_3 if stage == 1 else active_4
         rf      = rule_features[rule_num]
         prev_rf = rule_features.get(rule_num - 1)
+        mains   = draw_main_cards(np_rng, trials_per_rule, active)
+        orders  = draw_option_orders(np_rng, trials_per_rule)
+
+        # Fixed for the whole rule: compute once, not per trial.
+        non_rf      = tuple(p for p in active if p not in rf)
+        non_prev_rf = tuple(p for p in active if p not in prev_rf) if prev_rf else None
+        n_trans     = transition_trials if prev_rf is not None else 0
 
         for trial_i in range(trials_per_rule):
-            is_trans = (prev_rf is not None) and (trial_i < transition_trials)
             trial = generate_trial(rule_num, rf, active,
                                    prev_rule_features=prev_rf,
-                                   is_transition=is_trans)
+                                   is_transition=trial_i < n_trans,
+                                   main=mains[trial_i],
+                                   non_rf=non_rf,
+                                   non_prev_rf=non_prev_rf,
+                                   order=orders[trial_i],
+                                   rng=rng)
             trial["trial_index_in_rule"] = trial_i
-            all_trials.append(trial)
+            trial["stage"]               = stage
+            trial["is_first"]            = trial_i == 0
+            trial["is_last"]             = trial_i == trials_per_rule - 1
+            yield trial
+
 
-    return all_trials
+@lru_cache(maxsize=8)
+def _seeded_trials(trials_per_rule, transition_trials, seed):
+    return tuple(iter_all_trials(trials_per_rule, transition_trials, seed))
+
+
+def generate_all_trials(trials_per_rule=10, transition_trials=TRANSITION_TRIALS, seed=None):
+    """
+    Generate the full trial buffer as a list.
+    The app stops at 60 counted trials, but rule skips jump ahead by index,
+    so it needs random access to every rule's trials.
+    A fixed seed is deterministic, so those buffers are memoized; the trial
+    dicts are then shared between calls and must be treated as read-only.
+    """
+    if seed is None:
+        return list(iter_all_trials(trials_per_rule, transition_trials))
+    return list(_seeded_trials(trials_per_rule, transition_trials, seed))
 
 
 # ---------------------------------------------------------------------------
 # Answer checking
 # ---------------------------------------------------------------------------
 
+_VERDICTS = ("incorrect", "half_correct", "correct")
+
+
+def _classify(trial_data, selected_index):
+    """
+    The correct card matches on every rule feature, so "is correct" plus
+    "matches at least one rule feature" indexes straight into _VERDICTS.
+    """
+    diff = ((trial_data["main_u16"] ^ trial_data["options_u16"][selected_index])
+            & trial_data["rule_mask"])
+    any_match = DIFF_TABLE[diff] < len(trial_data["rule_features"])
+    return _VERDICTS[(selected_index == trial_data["correct"]) + any_match]
+
+
 def check_answer(trial_data, selected_index):
-    """Returns 'correct', 'half_correct', or 'incorrect'."""
-    if selected_index == trial_data["correct"]:
-        return "correct"
-    main     = trial_data["main"]
-    selected = trial_data["options"][selected_index]
-    n = count_matches(main, selected, trial_data["rule_features"])
-    return "half_correct" if n >= 1 else "incorrect"
+    """Returns 'correct', 'half_correct', or 'incorrect' (precomputed per option)."""
+    return trial_data["verdicts"][selected_index]
+
+
+def _perseverates(trial_data, selected_index):
+    mask = trial_data["prev_rule_mask"]
+    if not mask:
+        return False
+    return (trial_data["main_u16"] ^ trial_data["options_u16"][selected_index]) & mask == 0
 
 
 def is_perseveration(trial_data, selected_index):
     """
     True when a wrong answer matches the main card on BOTH features of the
     *previous* rule — participant is perseverating on the old rule.
-    Only meaningful when prev_rule_features is set.
+    Only meaningful when prev_rule_features is set (precomputed per option).
     """
-    prf = trial_data.get("prev_rule_features")
-    if not prf:
-        return False
-    main     = trial_data["main"]
-    selected = trial_data["options"][selected_index]
-    return count_matches(main, selected, prf) == len(prf)
+    return trial_data["perseverations"][selected_index]
@@ -1,65 +1,19 @@
+import os
+
 import streamlit as st
 
 # --- GLOBAL RTL + STYLE FIXES ---
-st.markdown("""
-<style>
-            
-/* Force dark background */
-.stApp {
-    background-color: #1E1E2E !important;
-}
-
-/* Also cover the sidebar and main block */
-section[data-testid="stSidebar"] {
-    background-color: #16161E !important;
-}
-
-/* Full RTL support */
-html, body, [class*="css"], .stMarkdown, .stText, p, div, ul, li {
-    direction: rtl !important;
-    text-align: right !important;
-}
+CSS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "static", "style.css")
 
-/* Light text for dark backgrounds */
-body, div, p, span, li, h1, h2, h3, h4, h5, h6 {
-    color: #F2F2F2 !important;
-}
 
-/* Title styling */
-.big-title {
-    font-size: 40px !important;
-    font-weight: bold;
-    color: #5DADE2;
-    margin-bottom: 25px;
-}
+@st.cache_data
+def _css():
+    with open(CSS_PATH, encoding="utf-8") as f:
+        return f"<style>{f.read()}</style>"
 
-/* Section header */
-.section-header {
-    font-size: 28px !important;
-    font-weight: bold;
-    color: #F5B041;
-    margin-top: 25px;
-}
 
-/* Bullet text */
-.bullet-text {
-    font-size: 22px !important;
-    line-height: 1.9;
-}
-
-/* Warning box */
-.warning-box {
-    background-color: #FDEDEC;
-    border-right: 6px solid #C0392B;
-    padding: 18px;
-    font-size: 22px;
-    margin-top: 25px;
-    color: #7B241C !important;
-    font-weight: 600;
-}
-
-</style>
-""", unsafe_allow_html=True)
+st.markdown(_css(), unsafe_allow_html=True)
 
 # --- PAGE CONTENT ---
 st.markdown("<div class='big-title'>ברוכים הבאים לגרסת הדמו של מבחן הקלפים</div>", unsafe_allow_html=True)
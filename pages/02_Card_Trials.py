@@ -1,15 +1,50 @@
 import sys, os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
+# The page re-executes on every rerun; only add the repo root once.
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+import io
+import pickle
+import re
 import streamlit as st
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 from card_generator import generate_all_trials, check_answer, is_perseveration
 
 MAX_COUNTED_TRIALS = 40
+MAIN_CARD_WIDTH    = 260
+OPTION_CARD_WIDTH  = 120
+FEEDBACK_SECONDS   = 1.2   # how long answer feedback stays on screen
+RULE_END_SECONDS   = 2     # how long the rule-end message stays on screen
+POLL_SECONDS       = 0.2   # deadline check interval while a message is shown
+SESSIONS_DIR       = os.path.join(_ROOT, ".sessions")
+SESSION_TTL        = 2 * 60 * 60   # seconds before an unfinished run is deleted
+
+# Everything _init_state sets except the trial buffer, which is saved once.
+_PROGRESS_KEYS = (
+    "trial", "counted_trials", "score", "consecutive_correct", "rules_found",
+    "perseveration_errors", "non_perseveration_errors", "extreme_mistakes",
+    "prev_answer_feedback", "prev_matched_positions", "prev_answer_rule",
+    "feedback", "show_feedback", "rule_end_message", "wait_until",
+    "rule_ends_at_index", "pending_rule_end", "rule_just_advanced",
+    "trial_start_time", "experiment_start_time", "trial_times", "done",
+)
+
+
+def _rule_starts(trials):
+    """Map each rule number to the index of its first trial."""
+    starts = {}
+    for i, t in enumerate(trials):
+        starts.setdefault(t["rule"], i)
+    return starts
 
 
 def _init_state():
     st.session_state.trials                   = generate_all_trials(trials_per_rule=10, transition_trials=3)
+    st.session_state.rule_starts              = _rule_starts(st.session_state.trials)
     st.session_state.trial                    = 0
     st.session_state.counted_trials           = 0
     st.session_state.score                    = 0
@@ -25,6 +60,7 @@ def _init_state():
     st.session_state.feedback                 = None
     st.session_state.show_feedback            = False
     st.session_state.rule_end_message         = False
+    st.session_state.wait_until               = 0.0    # when the shown message ends
     # ── Rule-trial limit (8 base, +1 per correct answer on last trial, max 10) ──
     st.session_state.rule_ends_at_index       = 7
     st.session_state.pending_rule_end         = False
@@ -33,18 +69,102 @@ def _init_state():
     st.session_state.trial_start_time         = time.time()
     st.session_state.experiment_start_time    = time.time()
     st.session_state.trial_times              = []   # list of (trial_number, seconds)
+    st.session_state.done                     = False
+    _sweep_sessions()
+    _dump(_session_path("trials"), {"trials": st.session_state.trials})
+    _save_progress()
+
+
+# ── Resume after refresh ────────────────────────────────────────────────────
+# Each browser tab carries a random ?sid=... in its URL. The trial buffer is
+# written once per (re)start and the small progress dict after every state
+# transition, so a refresh picks up where the participant left off.
+#
+# Retention: a session's files are deleted as soon as its run is done. Runs
+# that are abandoned (tab closed) are swept once they are SESSION_TTL seconds
+# old, whenever any session starts a new run.
+# The sid is the only key: anyone holding the URL can resume (and overwrite)
+# that run, and two tabs open on the same URL overwrite each other's progress.
+
+def _session_id():
+    sid = st.query_params.get("sid", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", sid):
+        sid = uuid.uuid4().hex
+        st.query_params["sid"] = sid
+    return sid
+
+
+def _session_path(kind):
+    return os.path.join(SESSIONS_DIR, f"{st.session_state.sid}.{kind}.pkl")
+
+
+def _dump(path, data):
+    os.makedirs(SESSIONS_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def _save_progress():
+    """Persist progress after a transition; a finished run is deleted instead."""
+    if st.session_state.done:
+        _discard_session()
+    else:
+        _dump(_session_path("progress"),
+              {k: st.session_state[k] for k in _PROGRESS_KEYS})
+
+
+def _discard_session():
+    for kind in ("trials", "progress"):
+        try:
+            os.remove(_session_path(kind))
+        except FileNotFoundError:
+            pass
+
+
+def _sweep_sessions():
+    """Delete every session file (including stray .tmp files) past the TTL."""
+    cutoff = time.time() - SESSION_TTL
+    try:
+        entries = list(os.scandir(SESSIONS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _restore_state():
+    """Load a saved session into session_state; False if there is none."""
+    saved = {}
+    try:
+        if os.path.getmtime(_session_path("progress")) < time.time() - SESSION_TTL:
+            return False
+        for kind in ("trials", "progress"):
+            with open(_session_path(kind), "rb") as f:
+                saved.update(pickle.load(f))
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False
+    if not all(k in saved for k in _PROGRESS_KEYS):
+        return False
+    for k, v in saved.items():
+        st.session_state[k] = v
+    st.session_state.rule_starts = _rule_starts(saved["trials"])
+    return True
 
 
 if "trials" not in st.session_state:
-    _init_state()
+    st.session_state.sid = _session_id()
+    if not _restore_state():
+        _init_state()
 
 TRIALS = st.session_state.trials
 
 
-def _is_first_trial_of_rule(trial_data):
-    return trial_data["trial_index_in_rule"] == 0
-
-
 def _advance_to_next_rule():
     """Jump to the first trial of the next rule and always reset the streak."""
     current_rule = TRIALS[st.session_state.trial]["rule"]
@@ -53,11 +173,7 @@ def _advance_to_next_rule():
     st.session_state.prev_answer_feedback   = None   # cross-rule context is cleared
     st.session_state.prev_matched_positions = None
     st.session_state.prev_answer_rule       = None
-    for i, t in enumerate(TRIALS):
-        if t["rule"] > current_rule:
-            st.session_state.trial = i
-            return
-    st.session_state.trial = len(TRIALS)
+    st.session_state.trial = st.session_state.rule_starts.get(current_rule + 1, len(TRIALS))
 
 
 def _get_matched_positions(main, selected, active_positions):
@@ -65,9 +181,186 @@ def _get_matched_positions(main, selected, active_positions):
     return frozenset(p for p in active_positions if main[p] == selected[p])
 
 
-def _game_over():
-    return (st.session_state.counted_trials >= MAX_COUNTED_TRIALS or
-            st.session_state.trial >= len(TRIALS))
+def _update_game_over():
+    """Called after every state transition; reruns just read the flag."""
+    st.session_state.done = (st.session_state.counted_trials >= MAX_COUNTED_TRIALS or
+                             st.session_state.trial >= len(TRIALS))
+
+
+@st.cache_resource(show_spinner=False)
+def _load_img(path, width):
+    """
+    Card image scaled to the width it is shown at, encoded once per server
+    process. st.image re-encodes RGB images as JPEG and shrinks anything wider
+    than `width`, so JPEG bytes at exactly that width pass through untouched
+    instead of being resized and re-encoded on every rerun.
+    """
+    with Image.open(path) as img:
+        height = int(1.0 * img.height * width / img.width)
+        small  = img.convert("RGB").resize((width, height), Image.LANCZOS)
+    buf = io.BytesIO()
+    small.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def _wait_then(on_done):
+    """
+    Hold the current screen until st.session_state.wait_until, then call
+    `on_done` and rerun the whole app. Polls from a fragment instead of
+    sleeping, so the script thread is free while the message is shown.
+    """
+    if time.time() >= st.session_state.wait_until:
+        on_done()
+        st.rerun()
+
+
+def _finish_rule_end():
+    st.session_state.rule_end_message = False
+    st.session_state.pending_rule_end = False
+    _advance_to_next_rule()
+    st.session_state.trial_start_time = time.time()   # reset timer for new trial
+    _update_game_over()
+    _save_progress()
+
+
+def _finish_feedback():
+    st.session_state.show_feedback = False
+    st.session_state.feedback = None
+
+    is_last_trial = st.session_state.pending_rule_end
+
+    if st.session_state.rule_just_advanced:
+        # trial pointer already set to first trial of new rule — don't increment
+        st.session_state.rule_just_advanced = False
+    else:
+        if is_last_trial:
+            st.session_state.rule_end_message = True
+            st.session_state.wait_until       = time.time() + RULE_END_SECONDS
+        st.session_state.trial += 1
+    _update_game_over()
+    _save_progress()
+
+
+def _on_select(trial_data, i):
+    """Score the chosen option; runs as the Select button's callback."""
+    if st.session_state.show_feedback:
+        # A second click queued before the feedback rerun: already scored.
+        return
+
+    rule_num      = trial_data["rule"]
+    first_of_rule = trial_data["is_first"]
+
+    # ── Record trial time ────────────────────────────────────────────────────
+    elapsed = time.time() - st.session_state.trial_start_time
+    trial_number = st.session_state.counted_trials + 1
+    st.session_state.trial_times.append((trial_number, elapsed))
+    st.session_state.trial_start_time = time.time()   # reset for next trial
+
+    fb   = check_answer(trial_data, i)
+    pers = is_perseveration(trial_data, i)
+
+    st.session_state.counted_trials += 1
+
+    if first_of_rule:
+        st.session_state.consecutive_correct = 0
+        # First trial of a new rule: clear prev context (cross-rule doesn't count)
+        st.session_state.prev_answer_feedback   = None
+        st.session_state.prev_matched_positions = None
+        st.session_state.prev_answer_rule       = None
+    else:
+        active   = trial_data["active_positions"]
+        main_c   = trial_data["main"]
+        selected_card = trial_data["options"][i]
+        cur_matched  = _get_matched_positions(main_c, selected_card, active)
+
+        # ── Extreme mistake detection ────────────────────────────────────────
+        prev_fb   = st.session_state.prev_answer_feedback
+        prev_pos  = st.session_state.prev_matched_positions
+        prev_rule = st.session_state.prev_answer_rule
+        same_rule = (prev_rule == rule_num)
+
+        is_extreme = False
+
+        if fb != "correct":
+            # Case 1: perseveration (also counted in perseveration_errors below)
+            if pers:
+                is_extreme = True
+
+            # Cases 2 & 3: only within the same rule
+            elif same_rule and prev_fb == "half_correct" and prev_pos is not None:
+                complementary = frozenset(active) - prev_pos
+                # Case 2: chose the exact same matching pair again
+                if cur_matched == prev_pos:
+                    is_extreme = True
+                # Case 3: chose the complementary pair
+                # (only meaningful in stage 2 where complement has ≥2 positions)
+                elif len(complementary) >= 2 and cur_matched == complementary:
+                    is_extreme = True
+
+            # Case 4: previous was fully wrong → this answer is not fully correct
+            elif same_rule and prev_fb == "incorrect":
+                is_extreme = True
+
+        if is_extreme:
+            st.session_state.extreme_mistakes += 1
+
+        # ── Standard scoring ─────────────────────────────────────────────────
+        if fb == "correct":
+            st.session_state.score += 1
+            st.session_state.consecutive_correct += 1
+        else:
+            st.session_state.consecutive_correct = 0
+            if pers:
+                st.session_state.perseveration_errors += 1
+            else:
+                st.session_state.non_perseveration_errors += 1
+
+        # ── Update prev-answer context for next trial ─────────────────────────
+        st.session_state.prev_answer_feedback   = fb
+        st.session_state.prev_matched_positions = cur_matched
+        st.session_state.prev_answer_rule       = rule_num
+
+    if st.session_state.consecutive_correct >= 3:
+        st.session_state.rules_found += 1
+        _advance_to_next_rule()
+        st.session_state.pending_rule_end   = False
+        st.session_state.rule_just_advanced = True
+    else:
+        # Check whether this was the last allowed trial for this rule
+        on_last = trial_data["trial_index_in_rule"] == st.session_state.rule_ends_at_index
+        if on_last:
+            # Correct on last trial and still have bonus budget → extend by 1
+            if fb == "correct" and not trial_data["is_last"]:
+                st.session_state.rule_ends_at_index += 1
+                st.session_state.pending_rule_end = False
+            else:
+                # Wrong answer on last trial, OR budget exhausted → end rule
+                st.session_state.pending_rule_end = True
+        else:
+            st.session_state.pending_rule_end = False
+
+    st.session_state.feedback      = fb
+    st.session_state.show_feedback = True
+    st.session_state.wait_until    = time.time() + FEEDBACK_SECONDS
+    _update_game_over()
+    _save_progress()
+
+
+@st.cache_resource
+def _prefetch_pool():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def _prefetch_trial(index):
+    """Warm the image cache for TRIALS[index] in the background."""
+    if index >= len(TRIALS):
+        return
+    t    = TRIALS[index]
+    pool = _prefetch_pool()
+    pool.submit(_load_img, t["main_path"], MAIN_CARD_WIDTH)
+    for path in t["option_paths"]:
+        pool.submit(_load_img, path, OPTION_CARD_WIDTH)
 
 
 def _fmt(seconds):
@@ -77,7 +370,7 @@ def _fmt(seconds):
 
 
 # ── End screen ──────────────────────────────────────────────────────────────
-if _game_over():
+if st.session_state.done:
     total_elapsed = time.time() - st.session_state.experiment_start_time
 
     st.title("Done!")
@@ -111,16 +404,14 @@ if _game_over():
         st.markdown(header + body)
 
     st.divider()
-    if st.button("Restart"):
-        _init_state()
-        st.rerun()
+    st.button("Restart", on_click=_init_state)
     st.stop()
 
 
 trial_data    = TRIALS[st.session_state.trial]
 rule_num      = trial_data["rule"]
-stage         = 1 if rule_num <= 2 else 2
-first_of_rule = _is_first_trial_of_rule(trial_data)
+stage         = trial_data["stage"]
+first_of_rule = trial_data["is_first"]
 
 # ── Live timer display ───────────────────────────────────────────────────────
 elapsed_this_trial = time.time() - st.session_state.trial_start_time
@@ -136,17 +427,14 @@ st.caption(
     f"Counted: {st.session_state.counted_trials}/{MAX_COUNTED_TRIALS}"
 )
 
-st.image(trial_data["main_path"], width=260)
+st.image(_load_img(trial_data["main_path"], MAIN_CARD_WIDTH), width=MAIN_CARD_WIDTH)
 
 # Rule-end message (10th trial exhausted)
 if st.session_state.rule_end_message:
     st.info("### השלב הסתיים, עוברים לשלב הבא")
-    time.sleep(2)
-    st.session_state.rule_end_message = False
-    st.session_state.pending_rule_end = False
-    _advance_to_next_rule()
-    st.session_state.trial_start_time = time.time()   # reset timer for new trial
-    st.rerun()
+    _prefetch_trial(st.session_state.rule_starts.get(rule_num + 1, len(TRIALS)))
+    _wait_then(_finish_rule_end)
+    st.stop()
 
 # Feedback display + advance
 if st.session_state.show_feedback:
@@ -158,120 +446,24 @@ if st.session_state.show_feedback:
     else:
         st.error("# Incorrect", icon="❌")
 
-    time.sleep(1.2)
-    st.session_state.show_feedback = False
-    st.session_state.feedback = None
-
-    streak        = st.session_state.consecutive_correct
-    is_last_trial = st.session_state.pending_rule_end
-
+    # The trial shown next is already known; load its cards while we wait.
     if st.session_state.rule_just_advanced:
-        # trial pointer already set to first trial of new rule — don't increment
-        st.session_state.rule_just_advanced = False
-        st.rerun()
-    elif is_last_trial:
-        st.session_state.rule_end_message = True
-        st.session_state.trial += 1
-        st.rerun()
+        _prefetch_trial(st.session_state.trial)
     else:
-        st.session_state.trial += 1
-        st.rerun()
+        _prefetch_trial(st.session_state.trial + 1)
+    _wait_then(_finish_feedback)
+    st.stop()
 
 # Option cards
+# The grid is one form per trial; each column's submit button selects its card.
 st.write("### Choose a card:")
-cols = st.columns(4)
+form = st.form(f"trial_{st.session_state.trial}", border=False)
+cols = form.columns(4)
+# Load the four option images concurrently (matters only on a cold cache).
+option_imgs = list(_prefetch_pool().map(_load_img, trial_data["option_paths"],
+                                        [OPTION_CARD_WIDTH] * 4))
 for i, col in enumerate(cols):
     with col:
-        st.image(trial_data["option_paths"][i], width=120)
-        if st.button("Select", key=f"opt_{st.session_state.trial}_{i}"):
-            # ── Record trial time ────────────────────────────────────────────
-            elapsed = time.time() - st.session_state.trial_start_time
-            trial_number = st.session_state.counted_trials + 1
-            st.session_state.trial_times.append((trial_number, elapsed))
-            st.session_state.trial_start_time = time.time()   # reset for next trial
-
-            fb = check_answer(trial_data, i)
-
-            st.session_state.counted_trials += 1
-
-            if first_of_rule:
-                st.session_state.consecutive_correct = 0
-                # First trial of a new rule: clear prev context (cross-rule doesn't count)
-                st.session_state.prev_answer_feedback   = None
-                st.session_state.prev_matched_positions = None
-                st.session_state.prev_answer_rule       = None
-            else:
-                active   = trial_data["active_positions"]
-                main_c   = trial_data["main"]
-                selected_card = trial_data["options"][i]
-                cur_matched  = _get_matched_positions(main_c, selected_card, active)
-
-                # ── Extreme mistake detection ────────────────────────────────
-                prev_fb   = st.session_state.prev_answer_feedback
-                prev_pos  = st.session_state.prev_matched_positions
-                prev_rule = st.session_state.prev_answer_rule
-                same_rule = (prev_rule == rule_num)
-
-                is_extreme = False
-
-                if fb != "correct":
-                    # Case 1: perseveration (also counted in perseveration_errors below)
-                    if is_perseveration(trial_data, i):
-                        is_extreme = True
-
-                    # Cases 2 & 3: only within the same rule
-                    elif same_rule and prev_fb == "half_correct" and prev_pos is not None:
-                        complementary = frozenset(active) - prev_pos
-                        # Case 2: chose the exact same matching pair again
-                        if cur_matched == prev_pos:
-                            is_extreme = True
-                        # Case 3: chose the complementary pair
-                        # (only meaningful in stage 2 where complement has ≥2 positions)
-                        elif len(complementary) >= 2 and cur_matched == complementary:
-                            is_extreme = True
-
-                    # Case 4: previous was fully wrong → this answer is not fully correct
-                    elif same_rule and prev_fb == "incorrect":
-                        is_extreme = True
-
-                if is_extreme:
-                    st.session_state.extreme_mistakes += 1
-
-                # ── Standard scoring ─────────────────────────────────────────
-                if fb == "correct":
-                    st.session_state.score += 1
-                    st.session_state.consecutive_correct += 1
-                else:
-                    st.session_state.consecutive_correct = 0
-                    if is_perseveration(trial_data, i):
-                        st.session_state.perseveration_errors += 1
-                    else:
-                        st.session_state.non_perseveration_errors += 1
-
-                # ── Update prev-answer context for next trial ─────────────────
-                st.session_state.prev_answer_feedback   = fb
-                st.session_state.prev_matched_positions = cur_matched
-                st.session_state.prev_answer_rule       = rule_num
-
-            if st.session_state.consecutive_correct >= 3:
-                st.session_state.rules_found += 1
-                _advance_to_next_rule()
-                st.session_state.pending_rule_end   = False
-                st.session_state.rule_just_advanced = True
-            else:
-                # Check whether this was the last allowed trial for this rule
-                on_last = trial_data["trial_index_in_rule"] == st.session_state.rule_ends_at_index
-                if on_last:
-                    # Correct on last trial and still have bonus budget → extend by 1
-                    if fb == "correct" and st.session_state.rule_ends_at_index < 9:
-                        st.session_state.rule_ends_at_index += 1
-                        st.session_state.pending_rule_end = False
-                    else:
-                        # Wrong answer on last trial, OR budget exhausted → end rule
-                        st.session_state.pending_rule_end = True
-                else:
-                    st.session_state.pending_rule_end = False
-
-            st.session_state.feedback      = fb
-            st.session_state.show_feedback = True
-            st.rerun()
\ No newline at end of file
+        st.image(option_imgs[i], width=OPTION_CARD_WIDTH)
+        st.form_submit_button("Select", key=f"opt_{st.session_state.trial}_{i}",
+                              on_click=_on_select, args=(trial_data, i))